@@ -1,23 +1,19 @@
+import os
 import re
+import json
+import shutil
+import hashlib
 import numpy as np
 import pandas as pd
-from thefuzz import fuzz
-from math import floor, ceil
-import matplotlib.pyplot as plt
-import fresh_data.get_datasets
-import importlib
-importlib.reload(fresh_data.get_datasets) # reload get_datasets every time this cell is run
-from fresh_data.get_datasets import *
+from fresh_data.get_datasets import (
+    load_polarization_data, load_FEC_data, load_KFF_data, get_yearly_populations, get_religions_and_geography,
+    get_FEC_years, get_FEC_congress, kff_filenames, fec_fill_values, file_sha256,
+)
 
-## Helpers:
-def merge_decennial(x,year_population_df,year):
-    state_population_in_year = year_population_df[year_population_df["Area"] == x["location"]].iloc[0][year]
-    x["population"] = state_population_in_year
-    return x
-
-def get_decennial_year(year):
-    return str(year[:-1]+"0")
+# Heavier dependencies (thefuzz, pyarrow, requests, bs4) are imported by the stages that use them,
+# so loading a cached dataframe (load_cached_df) only needs pandas.
 
+## Helpers:
 def jaro_distance(s1, s2) :
 
 	# If the strings are equal 
@@ -121,11 +117,14 @@ def jaro_winkler(s1, s2) :
 
 
 ## Entity Resolution:
-def fuzzy_entity_res(rep_1, rep_2):
+def fuzzy_entity_res(rep_1, rep_2, switch_threshold=70):
     """
         Returns an integer prediction of how close two strings are in similarity.
         100 is the highest level of similarity. 0 is the lowest.
+        Partial ratios below switch_threshold are re-scored with Jaro Winkler.
     """
+    from thefuzz import fuzz
+
     if pd.isna(rep_2):
         return 0
     
@@ -133,7 +132,7 @@ def fuzzy_entity_res(rep_1, rep_2):
     rep_2 = re.sub('[(),.]','',rep_2).lower().strip()
     prediction = fuzz.partial_ratio(rep_1, rep_2)
 
-    if prediction < 70: # Try using Jaro Winkler:
+    if prediction < switch_threshold: # Try using Jaro Winkler:
         prediction = jaro_winkler(rep_1, rep_2)
     return prediction
 
@@ -144,7 +143,7 @@ def get_match_subset(df_2, row_1, year_change):
     df_2_subset = df_2[match_area & (df_2["congress"] == row_1["congress"]+year_change)]
     return df_2_subset
 
-def check_subset(row_1, df_2, suffix_1, suffix_2):
+def check_subset(row_1, df_2, suffix_1, suffix_2, switch_threshold=70, match_threshold=69):
     """
         Perform entity resolution on a record in the polarize and census df 
         Only parses a subset of the FEC df which has matches in state, and district
@@ -163,13 +162,13 @@ def check_subset(row_1, df_2, suffix_1, suffix_2):
                 congress_str = f"no matches for congresses {row_1['congress']-1}-{row_1['congress']+1} | district: {row_1['district_code']}"
             continue
 
-        df_2_subset[f"distance_{suffix_1}_{suffix_2}"] = df_2_subset.apply(lambda row_2: fuzzy_entity_res(row_1[f"representative_{suffix_1}"], row_2[f"representative_{suffix_2}"]), axis=1)
+        df_2_subset[f"distance_{suffix_1}_{suffix_2}"] = df_2_subset.apply(lambda row_2: fuzzy_entity_res(row_1[f"representative_{suffix_1}"], row_2[f"representative_{suffix_2}"], switch_threshold), axis=1)
 
         # display(df_2_subset)
 
         closest_match_row = df_2_subset[df_2_subset[f"distance_{suffix_1}_{suffix_2}"]==df_2_subset[f"distance_{suffix_1}_{suffix_2}"].max()].iloc[0] # Get closest match
         row_1[f"{suffix_1}-{suffix_2}_closeness"] = df_2_subset[f'distance_{suffix_1}_{suffix_2}'].max()
-        if df_2_subset[f"distance_{suffix_1}_{suffix_2}"].max() < 69: # SHAW, Eugene Clay, Jr. - fec: SHAW, E CLAY JR is scored as 69, this should be a match.
+        if df_2_subset[f"distance_{suffix_1}_{suffix_2}"].max() < match_threshold: # SHAW, Eugene Clay, Jr. - fec: SHAW, E CLAY JR is scored as 69, this should be a match.
 
             # Save to be logged if we couldn't find a match in the other sessions of congress
             closest_str = f"no match, closest: {df_2_subset[f'distance_{suffix_1}_{suffix_2}'].max()}, for {suffix_1}: {row_1[f'representative_{suffix_1}']} - for {suffix_2}: {closest_match_row[f'representative_{suffix_2}']}"
@@ -192,35 +191,125 @@ def check_subset(row_1, df_2, suffix_1, suffix_2):
         row_1["fail"] = True 
     return row_1
         
-def fuzzy_merge(df_1, df_2, suffix_1, suffix_2):
+def fuzzy_merge(df_1, df_2, suffix_1, suffix_2, switch_threshold=70, match_threshold=69):
     # Apply merge algorithm on each record of df_1
     df_1.loc[:, f"representative_{suffix_1}"] = df_1["representative"]
     df_2.loc[:, f"representative_{suffix_2}"] = df_2["representative"]
 
     # Only include matches, remove all failed matches (NaNs):
-    match_df = df_1.apply(lambda row_1: check_subset(row_1, df_2, suffix_1, suffix_2), axis=1)
+    match_df = df_1.apply(lambda row_1: check_subset(row_1, df_2, suffix_1, suffix_2, switch_threshold, match_threshold), axis=1)
     # return match_df[~pd.isna(match_df["representative"])]
     return match_df
 
-def get_representative_information():
+## Candidate Pairs:
+def get_candidate_pairs(df_1, df_2, suffix_1, suffix_2):
+    """
+        Scores every candidate pair check_subset would look at: records of df_2 in the same state and district as a record
+        of df_1, in the same session of congress or the ones either side of it.
+        Returns a compact columnar table with one row per pair holding the block keys and both raw similarity scores
+        (partial ratio and Jaro Winkler), so thresholds can be applied afterwards with resolve_candidate_pairs.
+    """
+    from thefuzz import fuzz
+
+    keys = ["state_name", "district_code", "congress"]
+    left = df_1[keys+["representative"]].assign(left=df_1.index, left_position=np.arange(len(df_1)))
+    right = df_2[keys+["representative"]].assign(right=df_2.index, right_position=np.arange(len(df_2)))
+
+    # Block on state, district and session of congress (+/- 1):
+    blocks = []
+    for year_change in [0, -1, +1]:
+        block = pd.merge(
+            left.assign(congress=left["congress"]+year_change),
+            right,
+            how="inner",
+            on=keys,
+            suffixes=(f"_{suffix_1}", f"_{suffix_2}")
+        )
+        block["congress"] -= year_change
+        block["year_change"] = year_change
+        blocks.append(block)
+    pairs = pd.concat(blocks, ignore_index=True)
+
+    # Score each distinct pair of names once:
+    def clean(name):
+        return re.sub('[(),.]','',name).lower().strip()
+
+    names = pairs[[f"representative_{suffix_1}", f"representative_{suffix_2}"]].drop_duplicates()
+    scores = {}
+    for rep_1, rep_2 in names.itertuples(index=False):
+        if pd.isna(rep_2):
+            scores[(rep_1, rep_2)] = (0, 0)
+        else:
+            scores[(rep_1, rep_2)] = (fuzz.partial_ratio(clean(rep_1), clean(rep_2)), jaro_winkler(clean(rep_1), clean(rep_2)))
+    pair_scores = np.array([scores[pair] for pair in zip(pairs[f"representative_{suffix_1}"], pairs[f"representative_{suffix_2}"])]).reshape(-1, 2)
+
+    return pd.DataFrame({
+        "left": pairs["left"],
+        "right": pairs["right"],
+        "left_position": pairs["left_position"].astype(np.int32),
+        "right_position": pairs["right_position"].astype(np.int32),
+        "state_name": pairs["state_name"].astype("category"),
+        "district_code": pairs["district_code"].astype(np.int16),
+        "congress": pairs["congress"].astype(np.int16),
+        "year_change": pairs["year_change"].astype(np.int8),
+        f"representative_{suffix_1}": pairs[f"representative_{suffix_1}"].astype("category"),
+        f"representative_{suffix_2}": pairs[f"representative_{suffix_2}"].astype("category"),
+        "partial_ratio": pair_scores[:, 0].astype(np.uint8),
+        "jaro_winkler": pair_scores[:, 1], # kept at full precision so thresholds resolve exactly as in check_subset
+    })
+
+def resolve_candidate_pairs(pairs, switch_threshold=70, match_threshold=69):
+    """
+        Applies a pair of thresholds to a table from get_candidate_pairs, the same way check_subset does:
+        scores are partial ratios, or Jaro Winkler where the partial ratio is below switch_threshold. The sessions
+        are searched in the order 0, -1, +1 and the best candidate of the first session scoring at least match_threshold wins.
+        Returns one row per record of df_1 with candidates: the best candidate (right), its closeness and whether it is a match.
+    """
+    score = np.where(pairs["partial_ratio"] < switch_threshold, pairs["jaro_winkler"], pairs["partial_ratio"])
+    order = np.select([pairs["year_change"] == 0, pairs["year_change"] == -1], [0, 1], 2)
+    scored = pairs[["left", "right", "left_position", "right_position", "year_change"]].assign(closeness=score, order=order)
+
+    # Best candidate for each session searched (the first in df_2 on ties):
+    best = scored.sort_values(["left_position", "order", "closeness", "right_position"], ascending=[True, True, False, True])
+    best = best.drop_duplicates(["left_position", "order"])
+
+    # Take the first session with a match, otherwise report the last session searched:
+    best["match"] = best["closeness"] >= match_threshold
+    matches = best[best["match"]].drop_duplicates("left_position")
+    failures = best[~best["left_position"].isin(matches["left_position"])].drop_duplicates("left_position", keep="last")
+
+    resolved = pd.concat([matches, failures]).sort_values("left_position")
+    return resolved[["left", "right", "year_change", "closeness", "match"]].reset_index(drop=True)
+
+
+def get_representative_information(congresses=None, candidate_pairs=None):
     """
     Returns a dataframe composed of data from the following sources:
         - VoteView polarization data
         - FEC financial contributions for candidates
+    Restricted to the given sessions of congress, if any.
+    If candidate_pairs is a path, every scored candidate pair is also written there as parquet (see get_candidate_pairs).
     """
 
-    polarization = load_polarization_data()
-    fec = load_FEC_data("FEC/")
+    polarization = load_polarization_data(congresses=congresses)
+
+    # Entity resolution also searches the sessions either side of each congress:
+    if congresses is not None:
+        congresses = {congress+year_change for congress in congresses for year_change in [0, -1, +1]}
+    fec = load_FEC_data("FEC/", congresses=congresses)
 
     polarize_and_fec = fuzzy_merge(polarization, fec, "polarization", "fec")
 
+    if candidate_pairs is not None:
+        get_candidate_pairs(polarization, fec, "polarization", "fec").to_parquet(candidate_pairs, index=False)
+
     return polarize_and_fec
 	
 def get_state_demographics():
     """
     Returns a dataframe composed of data from the following sources:
         - KFF (Kaiser Family Foundation) Data on State demographics (race, poverty)
-        - Census Decennial demographics (total population)
+        - Census Decennial and yearly ACS demographics (total population)
         - PEW Research Center (religious populations)
     """
 
@@ -229,14 +318,19 @@ def get_state_demographics():
     us_mask = kff[kff["location"]=="United States"].index
     kff = kff.drop(us_mask)
 
-    # Load total population data per state
-    total_population = get_populations("census_demographics")
+    # Load total population data per state and year
+    total_population = get_yearly_populations("census_demographics")
 
     # load religions per state
     religions = get_religions_and_geography()
 
     # Merge KFF and population:
-    kff = kff.apply(lambda x: merge_decennial(x, total_population[["Area", get_decennial_year(str(x["year"]))]], get_decennial_year(str(x["year"]))),axis=1)
+    kff = pd.merge(
+        kff,
+        total_population,
+        how="left",
+        on=["location", "year"]
+    )
 
     # Merge KFF and religions:
 
@@ -270,17 +364,236 @@ def merge_state_and_reps(row_1, df_2):
     return pd.concat([row_1, match_row],axis=0)
 
 
+## Columns:
+# Columns of the merged dataframe, in order (renamed by get_column_name in get_df):
+merged_columns = [
+    # Polarization
+    "representative", "state_name", "district_code", "party", "congress", "year_range",
+    "born", "age", "nominate_dim1", "nominate_dim2", "nominate_number_of_votes",
+    "representative_polarization", "representative_fec", "polarization-fec_closeness",
+
+    # FEC
+    "running_as", "receipts", "contributions_from_individuals",
+    "contributions_from_pacs", "contributions_and_loans_from_candidate",
+    "disbursements", "cash_on_hand", "debts",
+
+    # State demographics
+    "poverty_children_0-18", "poverty_adults_19-64", "poverty_65+", "total_poverty",
+
+    "white", "black", "hispanic", "asian", "american_indian/alaska_native",
+    "native_hawaiian/other_pacific_islander", "multiple_races",
+
+    "Believe in God; absolutely certain",
+    "Believe in God; fairly certain",
+    "Believe in God; not too/not at all certain",
+    "Believe in God; don't know", "Do not believe in God",
+    "Other/don't know if they believe in God",
+
+    "Buddhist", "Catholic", "Evangelical Protestant", "Hindu",
+    "Historically Black Protestant", "Jehovah's Witness", "Jewish",
+    "Mainline Protestant", "Mormon", "Muslim", "Orthodox Christian", "Unaffiliated (religious \"nones\")",
+    "population",
+]
+
+def get_column_name(column):
+    # e.g. "Believe in God; don't know" -> believe_in_god_dont_know
+    return re.sub("['();\\\"]", '', column.strip().lower()).replace(' ', '_').replace('/', '_')
+
+# Columns of get_df holding text (or identifiers get_df casts to str); all of its other columns hold numbers.
+# Declared once so that every write of a dataset agrees on the column types, even for a session whose values are
+# all missing (e.g. a new congress whose FEC matches all failed):
+text_columns = ["representative", "state_name", "district_code", "party", "congress", "year_range", "born",
+    "representative_polarization", "representative_fec", "running_as"]
+
+
+## Storage:
+def get_schema(df, partition_cols=()):
+    """
+        Returns the explicit Arrow schema the merged dataframe is stored with.
+        The columns of get_df have declared types: text_columns (including congress, district_code and born, which
+        get_df casts to str) are strings and the rest are doubles, whatever values a particular write holds.
+        Other columns (e.g. of the state demographics snapshot) keep their type if they only hold numbers (or booleans)
+        and are stored as strings otherwise, including columns mixing text and numbers. Partition columns are always strings.
+    """
+    import pyarrow as pa
+
+    numeric_columns = [get_column_name(column) for column in merged_columns if get_column_name(column) not in text_columns]
+
+    fields = []
+    for column in df.columns:
+        if column in partition_cols or column in text_columns:
+            fields.append(pa.field(column, pa.string()))
+        elif column in numeric_columns:
+            fields.append(pa.field(column, pa.float64()))
+        elif pd.api.types.infer_dtype(df[column], skipna=True) in ["integer", "floating", "mixed-integer-float", "decimal", "boolean"]:
+            fields.append(pa.field(column, pa.array(df[column], from_pandas=True).type))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+def to_table(df, partition_cols=(), schema=None):
+    """
+        Converts df to an Arrow table with the given schema (by default get_schema's), converting the values of
+        string columns to str (missing values stay missing).
+        Raises a ValueError if df does not have the schema's columns or a column cannot be stored with its type.
+    """
+    import pyarrow as pa
+
+    if schema is None:
+        schema = get_schema(df, partition_cols)
+    if set(df.columns) != set(schema.names):
+        raise ValueError(f"columns {sorted(set(df.columns) ^ set(schema.names))} are not in both the dataframe and the schema")
+
+    df = df.astype({field.name: "string" for field in schema if field.type == pa.string()})
+    try:
+        return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as error:
+        raise ValueError(f"dataframe does not match the stored schema: {error}")
+
+def get_stored_schema(root):
+    # Schema of an existing dataset written by save_df (with its partition_cols in the metadata), or None if there is none:
+    import pyarrow.parquet as pq
+
+    if not os.path.exists(f"{root}/_common_metadata"):
+        return None
+    return pq.read_schema(f"{root}/_common_metadata")
+
+def get_partition_cols(root):
+    # Partition columns of an existing dataset written by save_df, or None if there is no dataset at root yet:
+    schema = get_stored_schema(root)
+    if schema is None:
+        return None
+    return schema.metadata[b"partition_cols"].decode().split(",")
+
+def save_df(df, root, partition_cols=("congress",)):
+    """
+        Writes the merged dataframe as a parquet dataset partitioned by congress (and optionally state_name),
+        e.g. root/congress=116/state_name=New York/part-0.parquet
+        Partitions being written replace any existing data in them; other partitions are left as is.
+        Writing into an existing dataset keeps its schema: the dataframe is cast to the stored column types, and a
+        different partitioning or columns which cannot be cast raise a ValueError.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    partition_cols = list(partition_cols)
+    stored_schema = get_stored_schema(root)
+    if stored_schema is None:
+        table = to_table(df, partition_cols)
+    else:
+        stored_partition_cols = get_partition_cols(root)
+        if stored_partition_cols != partition_cols:
+            raise ValueError(f"{root} is partitioned by {stored_partition_cols}, not {partition_cols}")
+        table = to_table(df, partition_cols, stored_schema.remove_metadata())
+    schema = table.schema.remove_metadata()
+
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([schema.field(column) for column in partition_cols]), flavor="hive"),
+        existing_data_behavior="delete_matching",
+    )
+
+    # Keep the full schema (with its column order and partitioning) next to the data for readers and later writes:
+    if stored_schema is None:
+        pq.write_metadata(schema.with_metadata({"partition_cols": ",".join(partition_cols)}), f"{root}/_common_metadata")
+
+def load_df(root, columns=None, congress=None, state=None):
+    """
+        Reads the merged dataframe written by save_df.
+        Params:
+            - columns: subset of columns to read
+            - congress: a session of congress (or list of sessions) to read
+            - state: a state name (or list of state names) to read
+        Only the partitions matching congress/state are opened, and only the requested columns are read from them.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    schema = get_stored_schema(root).remove_metadata()
+    partition_cols = get_partition_cols(root)
+    dataset = ds.dataset(
+        root,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([schema.field(column) for column in partition_cols]), flavor="hive"),
+    )
+
+    expression = None
+    for column, values in [("congress", congress), ("state_name", state)]:
+        if values is None:
+            continue
+        values = [str(value) for value in (values if isinstance(values, (list, tuple, set)) else [values])]
+        condition = ds.field(column).isin(values)
+        expression = condition if expression is None else expression & condition
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+def publish_snapshot(df, path):
+    """
+        Writes a dataframe as an uncompressed Arrow IPC file, for consumer processes to memory-map with load_snapshot
+        instead of each parsing (and holding its own copy of) a csv.
+        The file is written next to path and moved into place, so readers never map a partially written snapshot.
+    """
+    import pyarrow as pa
+
+    table = to_table(df)
+    with pa.OSFile(path+".tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path+".tmp", path)
+
+def load_snapshot(path, columns=None, as_table=False):
+    """
+        Memory-maps a snapshot written by publish_snapshot.
+        The Arrow table reads straight from the mapped file, so processes mapping the same snapshot share its pages
+        rather than each holding a copy. Converting to pandas keeps string columns and numeric columns without missing
+        values on the mapped buffers where pandas can; pass as_table=True to work on the Arrow table directly.
+    """
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table if as_table else table.to_pandas(split_blocks=True)
+
+def load_cached_df(path="full_df.csv", columns=None, congress=None, state=None):
+    """
+        Loads a previously built dataframe without running the merge pipeline:
+        either a parquet dataset written by get_df(output=path) or a csv saved with full_df.to_csv(path).
+        columns, congress and state select a subset as in load_df.
+    """
+    if os.path.isdir(path):
+        return load_df(path, columns=columns, congress=congress, state=state)
+
+    # Keep the dtypes get_df sets for identifiers:
+    df = pd.read_csv(path, index_col=0, dtype={"congress": str, "district_code": str, "born": str})
+    if congress is not None:
+        df = df[df["congress"].isin([str(value) for value in (congress if isinstance(congress, (list, tuple, set)) else [congress])])]
+    if state is not None:
+        df = df[df["state_name"].isin(state if isinstance(state, (list, tuple, set)) else [state])]
+    return df if columns is None else df[columns]
+
+
 ## Main:
-def get_df():
+def get_df(output=None, partition_cols=("congress",), congresses=None, snapshot=None):
     """
     Returns a dataframe with the merged tables from the following sources:
         State Demographics:
             - KFF (Kaiser Family Foundation) Data on State demographics (race, poverty)
-            - Census Decennial demographics (total population)
+            - Census Decennial and yearly ACS demographics (total population)
             - PEW Research Center (religious populations)
         Representative Information:
             - VoteView polarization data
             - FEC financial contributions for candidates
+    Params:
+        - output: optional directory to also write the dataframe to as a parquet dataset (see save_df/load_df);
+          without congresses, an existing dataset there is replaced
+        - partition_cols: columns the dataset is partitioned by, congress and optionally state_name
+        - congresses: only build the rows for these sessions of congress (see update_df)
+        - snapshot: optional directory to publish full_df.arrow and state_demographics.arrow to (see load_snapshot)
     """
 
     ## Load and merge tables:
@@ -289,7 +602,7 @@ def get_df():
     state_demographics_table = get_state_demographics()
 
     # Get representative information: 
-    representative_table = get_representative_information()
+    representative_table = get_representative_information(congresses)
 
     # Apply merge on representative table using helper entity resolution function:
     full_df = representative_table.apply(lambda row_1: merge_state_and_reps(row_1, state_demographics_table), axis=1)
@@ -320,51 +633,115 @@ def get_df():
     full_df.drop("total",inplace=True,axis=1)
 
     # Rename/Reorganize columns:
-    columns = [
-        # Polarization
-        "representative", "state_name", "district_code", "party", "congress", "year_range",
-        "born", "age", "nominate_dim1", "nominate_dim2", "nominate_number_of_votes", 
-        "representative_polarization", "representative_fec", "polarization-fec_closeness",
-        
-        # FEC
-        "running_as", "receipts", "contributions_from_individuals",
-        "contributions_from_pacs", "contributions_and_loans_from_candidate",
-        "disbursements", "cash_on_hand", "debts", 
-
-        # State demographics
-        "poverty_children_0-18", "poverty_adults_19-64", "poverty_65+", "total_poverty", 
-        
-        "white", "black", "hispanic", "asian", "american_indian/alaska_native",
-        "native_hawaiian/other_pacific_islander", "multiple_races", 
-
-        "Believe in God; absolutely certain",
-        "Believe in God; fairly certain",
-        "Believe in God; not too/not at all certain",
-        "Believe in God; don't know", "Do not believe in God",
-        "Other/don't know if they believe in God", 
-
-        "Buddhist", "Catholic", "Evangelical Protestant", "Hindu", 
-        "Historically Black Protestant", "Jehovah's Witness", "Jewish", 
-        "Mainline Protestant", "Mormon", "Muslim", "Orthodox Christian", "Unaffiliated (religious \"nones\")",
-        "population",
-    ]
+    columns = merged_columns
 
     full_df = full_df[columns]
 
-    full_df = full_df.rename({
-        column:re.sub("['();\\\"]", '', column.strip().lower()).replace(' ', '_').replace('/', '_') for column in columns
-    }, axis=1)
+    full_df = full_df.rename({column:get_column_name(column) for column in columns}, axis=1)
 
     # convert int values to objects for processing:
     for column in [ "district_code", "congress",  "born" ]: 
         full_df[column] = full_df[column].astype(str)
 
     # Replace NaNs in FEC:
-    values = {column:0 for column in load_FEC_data("FEC/").columns}
-    values["party"] = "No Party Affiliation"
+    values = dict(fec_fill_values)
 
     # Recode NaNs and drop rows with properly missing values:
     full_df = full_df.fillna(value=values)
     full_df.isna().sum()
 
-    return full_df
\ No newline at end of file
+    # Store as a partitioned parquet dataset (read back with load_df):
+    if output is not None:
+        # A full build replaces the dataset, so no sessions (or states) it no longer produces, nor their manifest entries, are left behind:
+        if congresses is None and get_stored_schema(output) is not None:
+            shutil.rmtree(output)
+        save_df(full_df, output, partition_cols)
+
+        # Record what the stored sessions were built from, for update_df:
+        write_manifest(output, get_source_fingerprints(load_polarization_data(congresses=congresses)))
+
+    # Publish memory-mappable snapshots for consumer processes:
+    if snapshot is not None:
+        os.makedirs(snapshot, exist_ok=True)
+        publish_snapshot(full_df, snapshot+"/full_df.arrow")
+        publish_snapshot(state_demographics_table, snapshot+"/state_demographics.arrow")
+
+    return full_df
+
+def get_merge_years(congress):
+    """
+        Returns the years merge_state_and_reps can take state demographics from for a session of congress.
+        check_subset gives each row the year_range of its FEC match, which can be the session before or after,
+        so the years of all three sessions are included.
+    """
+    years = set()
+    for year_change in [0, -1, +1]:
+        start = 1989+((congress+year_change-101)*2)
+        years.update([2008] if start+2 < 2008 else range(start, start+3))
+    return sorted(years)
+
+def get_source_fingerprints(polarization, FEC_root="FEC/", KFF_root="KFF/", census_root="census_demographics"):
+    """
+        Returns a fingerprint for each session of congress of the source data its rows are built from:
+        its VoteView rows, the FEC files for it and the sessions either side of it (searched during entity resolution),
+        and the KFF files and yearly state populations for the years it can be merged with (get_merge_years).
+    """
+    file_digests = {}
+    def file_digest(path):
+        # Each file is read once, though several sessions include it:
+        if path not in file_digests:
+            file_digests[path] = file_sha256(path).encode()
+        return file_digests[path]
+
+    FEC_files = {get_FEC_congress(year): FEC_root+f"ConCand4_{year}_24m.xlsx" for year in get_FEC_years(FEC_root)}
+    KFF_files = {int(year): [KFF_root+f"poverty/raw_data{key}.csv", KFF_root+f"race/raw_data{key}.csv"] for key, year in kff_filenames.items()}
+    populations = get_yearly_populations(census_root)
+
+    fingerprints = {}
+    for congress, rows in polarization.groupby("congress"):
+        digest = hashlib.sha256(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes())
+
+        for year_change in [0, -1, +1]:
+            if congress+year_change in FEC_files:
+                digest.update(file_digest(FEC_files[congress+year_change]))
+
+        years = get_merge_years(congress)
+        for year in years:
+            for path in KFF_files.get(year, []):
+                digest.update(file_digest(path))
+        digest.update(pd.util.hash_pandas_object(populations[populations["year"].isin(years)], index=False).to_numpy().tobytes())
+
+        fingerprints[str(congress)] = digest.hexdigest()
+    return fingerprints
+
+def read_manifest(root):
+    # Fingerprints of the sessions of congress stored in the dataset at root (see get_source_fingerprints):
+    try:
+        with open(f"{root}/_manifest.json") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def write_manifest(root, fingerprints):
+    manifest = read_manifest(root)
+    manifest.update(fingerprints)
+    with open(f"{root}/_manifest.json", "w") as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+
+def update_df(root):
+    """
+        Incrementally updates the parquet dataset written by get_df(output=root), keeping its partitioning and column
+        types (a new dataset is partitioned by congress).
+        Only sessions of congress which are new, or whose source data changed since they were written, are merged
+        (entity resolution and state demographics) and written; every other partition is left untouched.
+        Returns the sessions of congress that were updated.
+    """
+    manifest = read_manifest(root)
+    fingerprints = get_source_fingerprints(load_polarization_data())
+    congresses = [int(congress) for congress, fingerprint in fingerprints.items() if manifest.get(congress) != fingerprint]
+    if not congresses:
+        return []
+
+    # get_df records the new fingerprints in the manifest:
+    get_df(output=root, partition_cols=get_partition_cols(root) or ("congress",), congresses=congresses)
+    return congresses
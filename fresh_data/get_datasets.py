@@ -1,14 +1,11 @@
 
+import os
 import re
-import math
-import requests
-import geopandas
+import json
+import hashlib
 import numpy as np
 import pandas as pd
 from io import StringIO
-from bs4 import BeautifulSoup
-from fuzzywuzzy import process
-from fuzzymatcher import link_table, fuzzy_left_join
 
 state_mapping = {
     "AL": "Alabama",
@@ -85,6 +82,44 @@ cast_code_mapping = {
     "9" : "Not Voting (Abstention)"
 }
 
+# KFF exports are saved as raw_data (N).csv, one file per year:
+kff_filenames = {
+    "" : "2022",
+    " (1)" : "2021",
+    " (2)" : "2019",
+    " (3)" : "2018",
+    " (4)" : "2017",
+    " (5)" : "2016",
+    " (6)" : "2015",
+    " (7)" : "2014",
+    " (8)" : "2013",
+    " (9)" : "2012",
+    " (10)" : "2011",
+    " (11)" : "2010",
+    " (12)" : "2009",
+    " (13)" : "2008",
+}
+
+# Columns of load_FEC_data, in order:
+fec_columns = ['year_range', 'state_name', 'district_code', 'representative', 'party', 'running_as', 'receipts',
+    'contributions_from_individuals', 'contributions_from_pacs',
+    'contributions_and_loans_from_candidate', 'disbursements',
+    'cash_on_hand', 'debts', 'congress']
+
+# Values for the FEC fields of candidates missing from the FEC data (and of representatives without an FEC match).
+# Text fields get text, so the columns keep a single type:
+fec_fill_values = {column:0 for column in fec_columns}
+fec_fill_values["party"] = "No Party Affiliation"
+fec_fill_values["running_as"] = "Unknown"
+
+# Raw sources which can be refreshed with refresh_sources (target path: url).
+# KFF exports (KFF/*/raw_data (N).csv) are generated by KFF's site per request and have no stable url, so they are still downloaded by hand.
+source_urls = {
+    "fresh_data/member_ideology_house_all_years.csv": "https://voteview.com/static/data/out/members/Hall_members.csv",
+    "fresh_data/HSall_parties.csv": "https://voteview.com/static/data/out/parties/HSall_parties.csv",
+    **{f"FEC/ConCand4_{year}_24m.xlsx": f"https://www.fec.gov/files/bulk-downloads/{year}/ConCand4_{year}_24m.xlsx" for year in range(1990, 2024, 2)},
+}
+
 def string_to_percent(str_percent):
     str_num = re.sub("[%< ]", '', str_percent)
     if len(str_num) == 1:
@@ -117,9 +152,48 @@ def get_populations(root):
 
     return total_population_1970_2020
 
+def load_ACS_populations(root):
+    """
+        Loads total population per state from the census' yearly ACS (1-year DP05) exports, e.g. 2015.csv or ACSDP1Y2022.DP05-...csv
+        These are wide, with a "<State>!!Estimate" column per state; returns a long table of (location, year, population).
+    """
+    totals = {}
+    for filename in sorted(os.listdir(root)):
+        match = re.fullmatch(r"(?:ACSDP1Y)?(\d{4})\..*csv", filename)
+        if not match:
+            continue
+        acs_df = pd.read_csv(root+"/"+filename, dtype=str)
+        total_population = acs_df[acs_df.iloc[:, 0].str.strip() == "Total population"].iloc[0] # first occurrence, under "SEX AND AGE"
+        totals[int(match.group(1))] = total_population[[column for column in acs_df.columns if column.endswith("!!Estimate")]]
+
+    # Reshape every year at once: (year x "<State>!!Estimate") -> (location, year)
+    acs_populations = pd.DataFrame(totals).rename_axis(index="location", columns="year").stack().rename("population").reset_index()
+    acs_populations["location"] = acs_populations["location"].str.replace("!!Estimate", "")
+    acs_populations["population"] = acs_populations["population"].str.replace(",", "").astype(float)
+    return acs_populations
+
+def get_yearly_populations(root):
+    """
+        Returns total population per state (location) for every year from the first decennial census to the latest ACS export.
+        ACS estimates are used where available and decennial census counts otherwise; the years in between are interpolated linearly.
+    """
+    decennial = get_populations(root).set_index("Area").transpose()
+    decennial.index = decennial.index.astype(int)
+
+    acs = load_ACS_populations(root).pivot(index="year", columns="location", values="population")
+
+    populations = acs.combine_first(decennial.astype(float))
+    populations = populations.reindex(range(populations.index.min(), populations.index.max()+1))
+    populations = populations.interpolate(method="index", limit_area="inside")
+
+    return populations.rename_axis(index="year", columns="location").stack().dropna().rename("population").reset_index()
+
 def get_religions_and_geography():
     # Get religious composition of states as well as geographic data
 
+    import requests
+    from bs4 import BeautifulSoup
+
     # Scrape the PEW Research Center for their statistics on the current religous landscape:
     url = "https://www.pewresearch.org/religion/religious-landscape-study/state/"
     headers = {
@@ -166,8 +240,24 @@ def get_religions_and_geography():
 
     return full_table
 
+def get_FEC_years(root):
+    # Election years we have FEC summary files for, e.g. ConCand4_2022_24m.xlsx -> 2022
+    return sorted(int(filename[9:13]) for filename in os.listdir(root) if re.fullmatch(r"ConCand4_\d{4}_24m\.xlsx", filename))
+
+def get_FEC_congress(year):
+    # The FEC files are saved as the "last" year of the session, 1990 -> 1989-1991 -> 101st congress
+    return 101+((year-1990)//2)
+
 # Polarization data on representatives
-def load_polarization_data():
+def load_polarization_data(estimates=None, congresses=None):
+    """
+        Loads VoteView's member ideology data for the house.
+        Params:
+            - estimates: optional frame of (congress, icpsr, nominate_*) scores, e.g. from nominate.estimate_ideal_points,
+              which replace VoteView's published scores where present (such as a congress VoteView has not scored yet).
+              Only members already listed in the members file are updated, so it must include the estimated session.
+            - congresses: sessions of congress to load, by default every session we have FEC data or estimates for
+    """
 
     # Load from CSV:
     voteview_polarization_df = pd.read_csv("fresh_data/member_ideology_house_all_years.csv")
@@ -175,6 +265,12 @@ def load_polarization_data():
     # Remove president from assessment:
     voteview_polarization_df = voteview_polarization_df[voteview_polarization_df["chamber"]=="House"]
 
+    # Use our own ideal point estimates where we have them:
+    if estimates is not None:
+        voteview_polarization_df = voteview_polarization_df.set_index(["congress", "icpsr"])
+        voteview_polarization_df.update(estimates.set_index(["congress", "icpsr"]))
+        voteview_polarization_df = voteview_polarization_df.reset_index()
+
     # Get statename from state_abbrev:
     voteview_polarization_df["state_name"] = voteview_polarization_df["state_abbrev"].apply(lambda x: state_mapping[x])
 
@@ -193,9 +289,13 @@ def load_polarization_data():
        'nominate_number_of_errors', 'nokken_poole_dim1', 'nokken_poole_dim2',
        'state_name']]
     
-    # Restrict to FEC bounds of 1990-2022
-    mask_1999_2020 = (voteview_polarization_df["congress"] >= 101) & (116 >= voteview_polarization_df["congress"])
-    voteview_polarization_df = voteview_polarization_df[mask_1999_2020]
+    # Restrict to FEC bounds (1990 onwards, up to the latest FEC file):
+    if congresses is None:
+        congresses = [get_FEC_congress(year) for year in get_FEC_years("FEC/")]
+        if estimates is not None:
+            congresses += estimates["congress"].unique().tolist()
+    congress_mask = voteview_polarization_df["congress"].isin(congresses)
+    voteview_polarization_df = voteview_polarization_df[congress_mask]
 
     districts = ['American Samoa', 'District Of Columbia', 'Guam',
        'Puerto Rico', 'Virgin Islands', 'Northern Mariana Islands']
@@ -223,6 +323,13 @@ def load_polarization_data():
 
     return voteview_polarization_df
 
+# Rollcall votes of representatives
+def load_votes_data(congress, root="fresh_data"):
+    # VoteView's votes file for a single session of the house, e.g. H117_votes.csv
+    votes_df = pd.read_csv(root+f"/H{congress}_votes.csv")
+    votes_df = votes_df[votes_df["chamber"]=="House"]
+    return votes_df[["congress", "icpsr", "rollnumber", "cast_code"]]
+
 # Census data on poverty
 def load_census_poverty_data():
     # Load from CSV:
@@ -323,26 +430,9 @@ def load_open_secrets_data(root):
 def load_KFF_data(root):
     # https://www.kff.org/other/state-indicator/total-residents/?currentTimeframe=0&sortModel=%7B%22colId%22:%22Location%22,%22sort%22:%22asc%22%7D
 
-    filenames = {
-        "" : "2022",
-        " (1)" : "2021",
-        " (2)" : "2019",
-        " (3)" : "2018",
-        " (4)" : "2017",
-        " (5)" : "2016",
-        " (6)" : "2015",
-        " (7)" : "2014",
-        " (8)" : "2013",
-        " (9)" : "2012",
-        " (10)" : "2011",
-        " (11)" : "2010",
-        " (12)" : "2009",
-        " (13)" : "2008",
-    }
-
     full_kff = pd.DataFrame()
 
-    for key,value in filenames.items():
+    for key,value in kff_filenames.items():
         year_poverty = pd.read_csv(root+"poverty/"+f"raw_data{key}.csv",skiprows=2,skipfooter=20,engine="python").drop(["Footnotes"],axis=1)
         year_race = pd.read_csv(root+"race/"+f"raw_data{key}.csv",skiprows=2,skipfooter=20,engine="python").drop(["Footnotes","Total"],axis=1)
 
@@ -375,11 +465,14 @@ def load_KFF_data(root):
     return full_kff
 
 # Financial data on representatives
-def load_FEC_data(root):
+def load_FEC_data(root, congresses=None):
+    # congresses: sessions of congress to load, by default every FEC file in root
     dir = root
 
     full_df = pd.DataFrame()
-    for year in range(1990, 2022, 2):
+    for year in get_FEC_years(root):
+        if congresses is not None and get_FEC_congress(year) not in congresses:
+            continue
         year_range = f"{year-1}-{year+1}" # for whatever reason, the files save as the "last" year
 
         FEC_filename = f"ConCand4_{year}_24m.xlsx"
@@ -417,10 +510,7 @@ def load_FEC_data(root):
         'Cash On Hand' : "cash_on_hand",
         'Debts' : "debts",  
     }
-    full_df = full_df.rename(columns=columns)[['year_range', 'state_name', 'district_code', 'representative', 'party', 'running_as', 'receipts',
-        'contributions_from_individuals', 'contributions_from_pacs',
-        'contributions_and_loans_from_candidate', 'disbursements',
-        'cash_on_hand', 'debts']]
+    full_df = full_df.rename(columns=columns)[fec_columns[:-1]] # congress is added below
     
     # Get session of congress from year
     congress = 101
@@ -462,12 +552,8 @@ def load_FEC_data(root):
     full_df.loc[full_df[redistrict_mask].index, "district_code"] = 17
 
 
-    # Replace NaNs:
-    values = {column:0 for column in full_df.columns}
-    values["party"] = "No Party Affiliation"
-
     # Recode NaNs and drop rows with properly missing values:
-    full_df = full_df.fillna(value=values)
+    full_df = full_df.fillna(value=fec_fill_values)
 
     return full_df
 
@@ -506,6 +592,7 @@ def load_all_data(root="fresh_data"):
     df.drop(df[df["nominate_dim1"].isna()].index, inplace=True)
 
     # # Add OpenSecret data:
+    # from fuzzymatcher import fuzzy_left_join
     # opened_secrets = load_open_secrets_data(root)
 
     # left_on = ["bioname", "district_code", "state_name", "year_range_open_secrets"]
@@ -513,4 +600,104 @@ def load_all_data(root="fresh_data"):
 
     # df = fuzzy_left_join(df, opened_secrets, left_on, right_on)
 
-    return df
\ No newline at end of file
+    return df
+
+## Refreshing sources:
+def file_sha256(path):
+    # Hex sha256 checksum of a file (also used by data.get_source_fingerprints):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def fetch_source(url, path, entry=None):
+    """
+        Downloads url to path unless it is unchanged. Uses the ETag/Last-Modified of the previous download (entry)
+        for a conditional request when the file on disk still matches its checksum, and compares checksums so a
+        re-sent but identical file is not rewritten.
+        Returns the status ("not modified", "unchanged" or "updated") and the new mirror entry for the file.
+    """
+    import requests
+
+    headers = {
+        "User-Agent" : "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36",
+    }
+    # Only ask for changes since the previous download if the local copy is still that download (not edited or corrupted):
+    if entry is not None and entry.get("url") == url and os.path.exists(path) and file_sha256(path) == entry.get("sha256"):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = requests.get(url, headers=headers, timeout=60)
+    if response.status_code == 304:
+        return "not modified", entry
+    response.raise_for_status()
+
+    new_entry = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": hashlib.sha256(response.content).hexdigest(),
+    }
+    if os.path.exists(path) and file_sha256(path) == new_entry["sha256"]:
+        return "unchanged", new_entry
+
+    # Write next to the target and move into place, so readers never see a partial file:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path+".tmp", "wb") as file:
+        file.write(response.content)
+    os.replace(path+".tmp", path)
+    return "updated", new_entry
+
+async def fetch_sources(sources, mirror, concurrency):
+    import asyncio
+
+    # Run up to `concurrency` downloads at once, each in a worker thread:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(path, url):
+        async with semaphore:
+            return await asyncio.to_thread(fetch_source, url, path, mirror.get(path))
+
+    return await asyncio.gather(*[fetch(path, url) for path, url in sources.items()], return_exceptions=True)
+
+def refresh_sources(sources=source_urls, mirror_path="fresh_data/sources.json", concurrency=8):
+    """
+        Refreshes the local copies of the raw sources concurrently, skipping files which have not changed.
+        Params:
+            - sources: target path: url of each file to refresh (by default source_urls)
+            - mirror_path: json file recording the url, ETag, Last-Modified and checksum of each downloaded file
+            - concurrency: maximum number of downloads at once
+        Returns a dataframe with the status of each source; failed downloads are reported, not raised.
+    """
+    try:
+        with open(mirror_path) as file:
+            mirror = json.load(file)
+    except FileNotFoundError:
+        mirror = {}
+
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    # asyncio.run cannot be called from a running event loop (e.g. in a notebook), so use a separate thread there:
+    coroutine = fetch_sources(sources, mirror, concurrency)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        results = asyncio.run(coroutine)
+    else:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            results = executor.submit(asyncio.run, coroutine).result()
+
+    statuses = []
+    for (path, url), result in zip(sources.items(), results):
+        if isinstance(result, Exception):
+            statuses.append({"path": path, "url": url, "status": f"error: {result}"})
+            continue
+        status, entry = result
+        mirror[path] = entry
+        statuses.append({"path": path, "url": url, "status": status})
+
+    with open(mirror_path, "w") as file:
+        json.dump(mirror, file, indent=4, sort_keys=True)
+
+    return pd.DataFrame(statuses)
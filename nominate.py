@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+# Columns estimated here, named as in VoteView's member ideology files so the result can stand in for them:
+nominate_columns = [
+    "nominate_dim1", "nominate_dim2", "nominate_log_likelihood", "nominate_geo_mean_probability",
+    "nominate_number_of_votes", "nominate_number_of_errors",
+]
+
+## Helpers:
+def get_vote_matrix(votes_df):
+    """
+        Builds a (member x rollcall) matrix from a VoteView votes table (one congress).
+        Yeas (cast codes 1-3) are coded as 1, nays (4-6) as -1 and everything else
+        (absent, present, not a member) as 0.
+        Returns the member icpsr codes, the rollcall numbers and the matrix.
+    """
+    cast_code = votes_df["cast_code"].to_numpy()
+    values = np.select([np.isin(cast_code, [1, 2, 3]), np.isin(cast_code, [4, 5, 6])], [1, -1], 0)
+
+    members, member_index = np.unique(votes_df["icpsr"].to_numpy(), return_inverse=True)
+    rollcalls, rollcall_index = np.unique(votes_df["rollnumber"].to_numpy(), return_inverse=True)
+
+    matrix = np.zeros((len(members), len(rollcalls)), dtype=np.int8)
+    matrix[member_index, rollcall_index] = values
+    return members, rollcalls, matrix
+
+def filter_vote_matrix(matrix, minority=0.025, min_votes=20):
+    """
+        Returns masks of the rollcalls and members NOMINATE would scale:
+        rollcalls where the losing side has less than 2.5% of the votes and members
+        with fewer than 20 scaled votes carry no information about ideology.
+    """
+    yeas = (matrix == 1).sum(axis=0)
+    nays = (matrix == -1).sum(axis=0)
+    keep_rollcalls = np.minimum(yeas, nays) >= minority * np.maximum(yeas + nays, 1)
+    keep_members = (matrix[:, keep_rollcalls] != 0).sum(axis=1) >= min_votes
+    return keep_members, keep_rollcalls
+
+def sigmoid(x):
+    return 0.5 * (1 + np.tanh(0.5 * x))
+
+def constrain(x):
+    # Ideal points live in the unit circle, as in DW-NOMINATE:
+    norm = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norm, 1)
+
+def procrustes(source, target):
+    # Orthogonal map (rotation or reflection) that best takes source onto target:
+    u, _, vt = np.linalg.svd(source.T @ target)
+    return u @ vt
+
+def svd_start(matrix, observed):
+    """
+        Starting ideal points from the two leading singular vectors of the vote matrix,
+        with each rollcall centered on the members who voted on it.
+    """
+    counts = np.maximum(observed.sum(axis=0), 1)
+    centered = np.where(observed, matrix - matrix.sum(axis=0) / counts, 0)
+    u, s, _ = np.linalg.svd(centered, full_matrices=False)
+    return constrain(u[:, :2] * s[:2] / (s[0] * np.abs(u[:, 0]).max()))
+
+def pairwise_products(z):
+    # Products of each pair of columns of z (upper triangle), for building batched Hessians by matmul:
+    rows, columns = np.triu_indices(z.shape[1])
+    return z[:, rows] * z[:, columns], rows, columns
+
+def batched_hessians(weights, z, ridge):
+    """
+        Returns the stack of Hessians Z^T diag(w) Z + ridge*I, one per row of weights.
+        Built from a single matrix product so the work goes through multithreaded BLAS.
+    """
+    products, rows, columns = pairwise_products(z)
+    flat = weights @ products
+    hessians = np.zeros((weights.shape[0], z.shape[1], z.shape[1]))
+    hessians[:, rows, columns] = flat
+    hessians[:, columns, rows] = flat
+    hessians += ridge * np.eye(z.shape[1])
+    return hessians
+
+def update_rollcalls(x, params, yea, observed, ridge):
+    # One Newton step for every rollcall's (intercept, slope_dim1, slope_dim2) at once:
+    z = np.column_stack([np.ones(len(x)), x])
+    p = sigmoid(z @ params.T)
+    gradients = z.T @ ((yea - p) * observed) - ridge * params.T
+    hessians = batched_hessians((p * (1 - p) * observed).T, z, ridge)
+    return params + np.linalg.solve(hessians, gradients.T[..., None])[..., 0]
+
+def update_members(x, params, yea, observed, ridge):
+    # One Newton step for every member's (dim1, dim2) at once:
+    slopes = params[:, 1:]
+    p = sigmoid(params[:, 0] + x @ slopes.T)
+    gradients = ((yea - p) * observed) @ slopes - ridge * x
+    hessians = batched_hessians(p * (1 - p) * observed, slopes, ridge)
+    return constrain(x + np.linalg.solve(hessians, gradients[..., None])[..., 0])
+
+def log_likelihood(x, params, yea, observed):
+    p = sigmoid(params[:, 0] + x @ params[:, 1:].T)
+    p = np.clip(np.where(yea == 1, p, 1 - p), 1e-12, 1)
+    return (np.log(p) * observed).sum(axis=1), ((p < 0.5) & observed).sum(axis=1)
+
+
+## Estimation:
+def estimate_ideal_points(votes_df, previous=None, parties=None, max_iterations=100, tolerance=1e-6, ridge=0.1):
+    """
+        Estimates two-dimensional ideal points for one congress from its VoteView votes table.
+
+        Votes are modeled as P(yea) = logistic(a_j + b_j . x_i) for member i and rollcall j.
+        Members start from an SVD of the vote matrix, then the rollcall parameters and
+        ideal points are updated by alternating batched Newton steps until the log-likelihood
+        stops improving. Ideal points are kept inside the unit circle.
+
+        Params:
+            - votes_df: VoteView votes for a single congress (congress, icpsr, rollnumber, cast_code)
+            - previous: optional frame with icpsr, nominate_dim1 and nominate_dim2 (e.g. the previous
+              congress) used to warm-start returning members and orient the new space
+            - parties: optional frame with icpsr and party_code, used to point Republicans (200) to
+              the right on the first dimension when there is no previous congress to orient against
+
+        Returns a frame with one row per member, with the load_polarization_data nominate columns.
+        Members with fewer than 20 scaled votes are returned with missing scores.
+    """
+    members, _, matrix = get_vote_matrix(votes_df)
+    keep_members, keep_rollcalls = filter_vote_matrix(matrix)
+
+    votes = matrix[np.ix_(keep_members, keep_rollcalls)]
+    observed = votes != 0
+    yea = (votes == 1).astype(float)
+
+    # Start from the SVD, aligned to the previous congress for returning members:
+    x = svd_start(votes.astype(float), observed)
+    if previous is not None:
+        previous = previous.dropna(subset=["nominate_dim1", "nominate_dim2"]).drop_duplicates("icpsr").set_index("icpsr")
+        returning = np.isin(members[keep_members], previous.index)
+        prior = previous.reindex(members[keep_members][returning])[["nominate_dim1", "nominate_dim2"]].to_numpy()
+        if returning.sum() >= 2:
+            x = constrain(x @ procrustes(x[returning], prior))
+            x[returning] = prior
+
+    params = np.zeros((votes.shape[1], 3))
+    last = -np.inf
+    for _ in range(max_iterations):
+        params = update_rollcalls(x, params, yea, observed, ridge)
+        x = update_members(x, params, yea, observed, ridge)
+
+        member_log_likelihood, errors = log_likelihood(x, params, yea, observed)
+        total = member_log_likelihood.sum()
+        if abs(total - last) <= tolerance * abs(total):
+            break
+        last = total
+
+    # Orient the final space:
+    if previous is not None and returning.sum() >= 2:
+        x = x @ procrustes(x[returning], prior)
+    elif parties is not None:
+        party_code = parties.drop_duplicates("icpsr").set_index("icpsr").reindex(members[keep_members])["party_code"]
+        republicans = (party_code == 200).to_numpy()
+        if republicans.any() and x[republicans, 0].mean() < 0:
+            x[:, 0] = -x[:, 0]
+
+    number_of_votes = observed.sum(axis=1)
+    estimates = pd.DataFrame({
+        "congress": votes_df["congress"].iloc[0],
+        "icpsr": members,
+    })
+    estimates.loc[keep_members, "nominate_dim1"] = x[:, 0]
+    estimates.loc[keep_members, "nominate_dim2"] = x[:, 1]
+    estimates.loc[keep_members, "nominate_log_likelihood"] = member_log_likelihood
+    estimates.loc[keep_members, "nominate_geo_mean_probability"] = np.exp(member_log_likelihood / number_of_votes)
+    estimates.loc[keep_members, "nominate_number_of_votes"] = number_of_votes
+    estimates.loc[keep_members, "nominate_number_of_errors"] = errors
+
+    return estimates[["congress", "icpsr"] + nominate_columns]
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Numeric columns of get_df used as regression features by default (as in the final notebook):
+default_features = [
+    ## representative data:
+    "age", "nominate_number_of_votes",
+    "receipts", "contributions_from_individuals", "contributions_from_pacs",
+    "contributions_and_loans_from_candidate", "disbursements", "cash_on_hand", "debts",
+
+    ## state data:
+    "total_poverty", "white", "black", "hispanic", "asian", "multiple_races",
+
+    "believe_in_god_absolutely_certain", "believe_in_god_fairly_certain",
+    "believe_in_god_not_too_not_at_all_certain", "believe_in_god_dont_know", "do_not_believe_in_god",
+
+    "buddhist", "catholic", "evangelical_protestant", "hindu", "historically_black_protestant",
+    "jehovahs_witness", "jewish", "mainline_protestant", "mormon", "muslim", "orthodox_christian",
+    "unaffiliated_religious_nones",
+
+    "population",
+]
+
+## Helpers:
+def get_feature_matrix(df, features=default_features, categorical=("party",), target="nominate_dim1"):
+    """
+        Builds the NumPy arrays the resampling functions work on from a get_df dataframe:
+            - X: an intercept column, the standardized numeric features and one-hot categorical features (first level dropped)
+            - y: the target column
+            - groups: the session of congress of each row, for leave-one-congress-out fits
+        Also returns the names of the columns of X. Rows missing a feature or the target are left out of all three arrays,
+        since a single NaN would make every least-squares solve NaN.
+    """
+    df = df.dropna(subset=list(features) + list(categorical) + [target])
+
+    numeric = df[list(features)].astype(float)
+    numeric = (numeric - numeric.mean()) / numeric.std().replace(0, 1)
+
+    dummies = pd.get_dummies(df[list(categorical)], drop_first=True, dtype=float)
+
+    X = pd.concat([numeric, dummies], axis=1)
+    X.insert(0, "intercept", 1.0)
+
+    return X.to_numpy(), df[target].to_numpy(dtype=float), df["congress"].to_numpy(), X.columns.to_list()
+
+def batched_least_squares(X, y, weights, ridge=1e-6):
+    """
+        Fits one weighted least-squares regression per row of weights (replicates x observations) at once.
+        The normal equations of every replicate are built with one einsum and one matrix product and solved as a batch.
+        A small ridge (relative to each replicate's size) keeps the nearly collinear shares (e.g. religions) solvable.
+        Returns the coefficients (replicates x features) and each replicate's in-sample R^2.
+    """
+    sizes = weights.sum(axis=1)
+    XtWX = np.einsum("bn,ni,nj->bij", weights, X, X, optimize=True) + (ridge * sizes)[:, None, None] * np.eye(X.shape[1])
+    XtWy = weights @ (X * y[:, None])
+    coefficients = np.linalg.solve(XtWX, XtWy[..., None])[..., 0]
+
+    # Weighted residual and total sums of squares, without forming any residuals:
+    yty = weights @ (y * y)
+    residual = yty - 2 * (coefficients * XtWy).sum(axis=1) + np.einsum("bi,bij,bj->b", coefficients, XtWX, coefficients)
+    total = yty - (weights @ y) ** 2 / sizes
+    return coefficients, 1 - residual / total
+
+def bootstrap_chunk(X, y, replicates, seed):
+    # Bootstrap samples as multinomial counts, i.e. observation weights:
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(len(y), np.full(len(y), 1 / len(y)), size=replicates).astype(float)
+    return batched_least_squares(X, y, weights)
+
+def to_frame(coefficients, r2, columns, index=None):
+    replicates = pd.DataFrame(coefficients, columns=columns, index=index)
+    replicates["r2"] = r2
+    return replicates
+
+
+## Resampling:
+def bootstrap(X, y, columns, replicates=1000, chunk_size=250, processes=None, seed=0):
+    """
+        Returns the coefficients (and R^2) of a linear regression refit on bootstrap resamples of the rows of X, one row per replicate.
+        Replicates are fit in batches of chunk_size and the batches are spread across a process pool
+        (processes=1 fits them in this process). Each batch gets its own seed spawned from seed, so results
+        do not depend on the number of processes.
+    """
+    chunks = [min(chunk_size, replicates - start) for start in range(0, replicates, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    if processes == 1:
+        results = [bootstrap_chunk(X, y, chunk, chunk_seed) for chunk, chunk_seed in zip(chunks, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(bootstrap_chunk, [X]*len(chunks), [y]*len(chunks), chunks, seeds))
+
+    coefficients = np.concatenate([result[0] for result in results])
+    r2 = np.concatenate([result[1] for result in results])
+    return to_frame(coefficients, r2, columns)
+
+def leave_one_congress_out(X, y, groups, columns):
+    """
+        Returns the coefficients (and R^2) of a linear regression refit once without each session of congress,
+        indexed by the session left out. Large swings show which sessions the overall fit depends on.
+    """
+    congresses = np.unique(groups)
+    weights = (groups[None, :] != congresses[:, None]).astype(float)
+    coefficients, r2 = batched_least_squares(X, y, weights)
+    return to_frame(coefficients, r2, columns, index=pd.Index(congresses, name="left_out_congress"))
+
+def summarize_replicates(replicates, level=0.95):
+    """
+        Summarizes the replicates of bootstrap or leave_one_congress_out: mean, standard error and
+        the percentile interval at the given confidence level for each coefficient (and R^2).
+    """
+    alpha = (1 - level) / 2
+    return pd.DataFrame({
+        "mean": replicates.mean(),
+        "std": replicates.std(),
+        "lower": replicates.quantile(alpha),
+        "upper": replicates.quantile(1 - alpha),
+    })
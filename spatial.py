@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from fresh_data.get_datasets import state_mapping
+
+## State Adjacency:
+def build_state_adjacency(shapefile="fresh_data/geodata/usa-states-census-2014.shp"):
+    """
+        Computes which states share a border (or a corner) from the census states shapefile.
+        States are keyed by their state_mapping names; Alaska and Hawaii, which the shapefile does not include,
+        are kept as states without neighbors.
+        Returns the state names and a symmetric sparse (states x states) adjacency matrix.
+    """
+    import geopandas
+
+    states = geopandas.read_file(shapefile).dissolve(by="STUSPS").reset_index()[["STUSPS", "geometry"]]
+    names = sorted(state_mapping[abbrev] for abbrev in set(states["STUSPS"]) | {"AK", "HI"})
+    states["position"] = [names.index(state_mapping[abbrev]) for abbrev in states["STUSPS"]]
+
+    # One spatial join over all pairs of states instead of a touches test per pair:
+    pairs = geopandas.sjoin(states, states, how="inner", predicate="intersects")
+    pairs = pairs[pairs["position_left"] != pairs["position_right"]]
+
+    adjacency = sparse.coo_matrix(
+        (np.ones(len(pairs)), (pairs["position_left"], pairs["position_right"])),
+        shape=(len(names), len(names))
+    ).tocsr()
+    adjacency.data[:] = 1
+    return names, adjacency
+
+def get_state_adjacency(cache="fresh_data/geodata/state_adjacency.npz", shapefile="fresh_data/geodata/usa-states-census-2014.shp"):
+    """
+        Returns the state names and sparse adjacency matrix of build_state_adjacency, computing it from the
+        shapefile only the first time and reading it from cache afterwards.
+    """
+    if os.path.exists(cache):
+        stored = np.load(cache)
+        names = stored["names"].tolist()
+        adjacency = sparse.csr_matrix((np.ones(len(stored["rows"])), (stored["rows"], stored["columns"])), shape=(len(names), len(names)))
+        return names, adjacency
+
+    names, adjacency = build_state_adjacency(shapefile)
+    rows, columns = adjacency.nonzero()
+    np.savez_compressed(cache, names=np.array(names), rows=rows, columns=columns)
+    return names, adjacency
+
+
+## Spatial Metrics:
+def get_state_values(df, names, column="nominate_dim1", party=None, statistic="mean"):
+    """
+        Aggregates a column of a get_df dataframe per state and session of congress (e.g. the mean nominate_dim1 of
+        each state's delegation), optionally for a single party.
+        Returns a (congress x state) table with the states in adjacency order; states without members are missing.
+    """
+    if party is not None:
+        df = df[df["party"] == party]
+    values = df.groupby(["congress", "state_name"])[column].agg(statistic).unstack("state_name")
+    values.index = values.index.astype(int)
+    return values.sort_index().reindex(columns=names)
+
+def get_spatial_lag(values, adjacency):
+    """
+        Returns the spatial lag of a (congress x state) table: the average value of each state's neighbors,
+        for every session of congress at once. Missing states are left out of their neighbors' averages.
+    """
+    observed = values.notna().to_numpy(dtype=float)
+    totals = (adjacency @ values.fillna(0).to_numpy().T).T
+    counts = (adjacency @ observed.T).T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame(totals / np.where(counts > 0, counts, np.nan), index=values.index, columns=values.columns)
+
+def get_morans_i(values, adjacency):
+    """
+        Returns Moran's I of a (congress x state) table for every session of congress, using row-standardized
+        adjacency weights over the states observed in that session. Values near 1 mean neighboring states
+        look alike (regional clustering), near the expected value -1/(n-1) means no spatial pattern.
+    """
+    observed = values.notna().to_numpy()
+    deviations = values.sub(values.mean(axis=1), axis=0).fillna(0)
+
+    lag = get_spatial_lag(deviations.where(observed), adjacency).to_numpy()
+    has_neighbors = observed & ~np.isnan(lag)
+
+    n = observed.sum(axis=1)
+    cross_products = np.where(has_neighbors, deviations.to_numpy() * np.nan_to_num(lag), 0).sum(axis=1)
+    variance = (deviations.to_numpy() ** 2).sum(axis=1)
+
+    return pd.DataFrame({
+        "morans_i": n / has_neighbors.sum(axis=1) * cross_products / variance,
+        "expected": -1 / (n - 1),
+        "states": n,
+    }, index=values.index)
+
+def get_spatial_metrics(df, column="nominate_dim1", party=None, statistic="mean"):
+    """
+        Reports regional clustering of a column of a get_df dataframe for every session of congress in one pass.
+        Returns Moran's I per congress, and the per-state values with their spatial lags in long format.
+    """
+    names, adjacency = get_state_adjacency()
+    values = get_state_values(df, names, column, party, statistic)
+    lag = get_spatial_lag(values, adjacency)
+
+    states = pd.concat({column: values.stack(), f"{column}_spatial_lag": lag.stack()}, axis=1).reset_index()
+    return get_morans_i(values, adjacency), states
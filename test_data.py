@@ -0,0 +1,114 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from data import (
+    save_df, load_df, get_partition_cols, get_merge_years, publish_snapshot, load_snapshot, fec_fill_values,
+    fuzzy_merge, get_candidate_pairs, resolve_candidate_pairs,
+)
+
+
+def get_merged_rows():
+    # One representative matched to the FEC data and one who failed entity resolution, filled as get_df fills them:
+    df = pd.DataFrame({
+        "representative": ["SMITH, John", "DOE, Jane"],
+        "state_name": ["Ohio", "Iowa"],
+        "district_code": ["1", "2"],
+        "party": ["Democratic Party", np.nan],
+        "congress": ["116", "116"],
+        "running_as": ["INCUMBENT", np.nan],
+        "receipts": [1000.0, np.nan],
+        "nominate_dim1": [-0.3, 0.4],
+    })
+    return df.fillna(value=fec_fill_values)
+
+def test_save_df_with_unmatched_row(tmp_path):
+    df = get_merged_rows()
+    save_df(df, str(tmp_path / "full_df"), ("congress", "state_name"))
+
+    loaded = load_df(str(tmp_path / "full_df")).sort_values("representative", ignore_index=True)
+    expected = df.sort_values("representative", ignore_index=True)
+    assert loaded["running_as"].tolist() == expected["running_as"].tolist()
+    assert loaded["receipts"].tolist() == expected["receipts"].tolist()
+    assert loaded["congress"].tolist() == ["116", "116"]
+
+def test_save_df_with_mixed_column(tmp_path):
+    # Text and numbers in one column are stored as strings:
+    df = get_merged_rows().assign(running_as=["INCUMBENT", 0])
+    save_df(df, str(tmp_path / "full_df"))
+
+    loaded = load_df(str(tmp_path / "full_df"), state="Iowa")
+    assert loaded["running_as"].tolist() == ["0"]
+
+def test_snapshot_with_mixed_column(tmp_path):
+    df = get_merged_rows().assign(running_as=["INCUMBENT", 0])
+    publish_snapshot(df, str(tmp_path / "full_df.arrow"))
+
+    loaded = load_snapshot(str(tmp_path / "full_df.arrow"))
+    assert loaded["running_as"].tolist() == ["INCUMBENT", "0"]
+    assert loaded["nominate_dim1"].tolist() == [-0.3, 0.4]
+
+def test_save_df_keeps_partitioning(tmp_path):
+    root = str(tmp_path / "full_df")
+    save_df(get_merged_rows(), root, ("congress", "state_name"))
+    assert get_partition_cols(root) == ["congress", "state_name"]
+
+    # Appending with another partitioning would leave the old partitions unreadable by state:
+    with pytest.raises(ValueError):
+        save_df(get_merged_rows().assign(congress="117"), root, ("congress",))
+
+    save_df(get_merged_rows().assign(congress="117"), root, ("congress", "state_name"))
+    assert len(load_df(root, state="Ohio")) == 2
+
+def test_merge_years_cover_neighbouring_sessions():
+    # Rows of the 110th congress (2007-2009) can take the year_range of an FEC match from the 109th or 111th:
+    assert get_merge_years(110) == [2007, 2008, 2009, 2010, 2011]
+    assert get_merge_years(102) == [2008]
+
+def test_save_df_keeps_column_types(tmp_path):
+    root = str(tmp_path / "full_df")
+    save_df(get_merged_rows().assign(representative_fec=["SMITH, JOHN", "DOE, JANE"], age=[50, 60], x=["a", "b"]), root)
+
+    # A later session where every FEC match failed and the inferred dtypes differ:
+    later = get_merged_rows().assign(congress="117", representative_fec=np.nan, age=[50.5, 60.5], x=np.nan)
+    save_df(later, root)
+
+    loaded = load_df(root).sort_values(["congress", "representative"], ignore_index=True)
+    assert loaded["representative_fec"].tolist()[:2] == ["DOE, JANE", "SMITH, JOHN"]
+    assert loaded["representative_fec"].isna().tolist()[2:] == [True, True]
+    assert loaded["age"].tolist() == [60.0, 50.0, 60.5, 50.5]
+    assert loaded["x"].tolist()[:2] == ["b", "a"]
+    assert len(load_df(root, congress=116)) == 2
+
+    # Text in a numeric column cannot be stored:
+    with pytest.raises(ValueError):
+        save_df(get_merged_rows().assign(congress="118", representative_fec=np.nan, age="unknown", x=np.nan), root)
+
+@pytest.mark.parametrize("switch_threshold, match_threshold", [(70, 69), (50, 80), (90, 60), (70, 95)])
+def test_candidate_pairs_resolve_like_fuzzy_merge(switch_threshold, match_threshold):
+    pytest.importorskip("thefuzz")
+
+    polarization = pd.DataFrame({
+        "representative": ["SMITH, John Robert", "GARCIA, Maria", "SHAW, Eugene Clay, Jr.", "O'BRIEN, Patrick", "LEE, Ann"],
+        "state_name": ["Ohio", "Ohio", "Florida", "Iowa", "Iowa"],
+        "district_code": [1, 2, 22, 3, 3],
+        "congress": [116, 116, 103, 110, 111],
+    })
+    # Candidates in the same session and the sessions either side, scoring on both sides of the thresholds:
+    fec = pd.DataFrame({
+        "representative": ["SMYTHE, JON", "SMITH, JOHN R", "GARZA, MARIO", "GARCIA, MARIA ELENA", "SHAW, E CLAY JR", "OBRIAN, PAT", "LEE, ANNE", "BROWN, TOM"],
+        "state_name": ["Ohio", "Ohio", "Ohio", "Ohio", "Florida", "Iowa", "Iowa", "Iowa"],
+        "district_code": [1, 1, 2, 2, 22, 3, 3, 3],
+        "congress": [116, 117, 116, 115, 103, 110, 110, 111],
+        "year_range": ["2019-2021", "2021-2023", "2019-2021", "2017-2019", "1993-1995", "2007-2009", "2007-2009", "2009-2011"],
+        "receipts": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0],
+    })
+
+    merged = fuzzy_merge(polarization.copy(), fec.copy(), "polarization", "fec", switch_threshold, match_threshold)
+    resolved = resolve_candidate_pairs(get_candidate_pairs(polarization, fec, "polarization", "fec"), switch_threshold, match_threshold)
+
+    assert resolved["left"].tolist() == merged.index.tolist()
+    assert resolved["match"].tolist() == (~merged["fail"].astype(bool)).tolist()
+    assert resolved["closeness"].tolist() == pytest.approx(merged["polarization-fec_closeness"].tolist())
+    matched = resolved[resolved["match"]]
+    assert fec.loc[matched["right"], "representative"].tolist() == merged.loc[matched["left"], "representative_fec"].tolist()
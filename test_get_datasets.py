@@ -0,0 +1,72 @@
+import os
+import json
+import hashlib
+import threading
+import pytest
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from fresh_data.get_datasets import refresh_sources
+
+requests = pytest.importorskip("requests")
+
+
+class ConditionalHandler(SimpleHTTPRequestHandler):
+    # Serves a directory with ETags, answering 304 when If-None-Match matches the file's current ETag:
+    def send_head(self):
+        path = self.translate_path(self.path)
+        self.etag = None
+        if os.path.isfile(path):
+            with open(path, "rb") as file:
+                self.etag = '"' + hashlib.md5(file.read()).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == self.etag:
+                self.send_response(304)
+                self.end_headers()
+                return None
+        return super().send_head()
+
+    def end_headers(self):
+        if self.etag is not None:
+            self.send_header("ETag", self.etag)
+        super().end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(ConditionalHandler, directory=str(served)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield served, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+def test_refresh_sources(server, tmp_path):
+    served, url = server
+    (served / "members.csv").write_text("congress,icpsr\n117,1\n")
+    local = str(tmp_path / "mirror" / "members.csv")
+    sources = {local: url + "/members.csv", str(tmp_path / "mirror" / "missing.csv"): url + "/missing.csv"}
+    mirror_path = str(tmp_path / "sources.json")
+
+    statuses = refresh_sources(sources, mirror_path)
+    assert statuses["status"].tolist()[0] == "updated"
+    assert statuses["status"].tolist()[1].startswith("error: 404")
+    assert open(local).read() == "congress,icpsr\n117,1\n"
+
+    # Unchanged on the server, so the conditional request is answered with a 304:
+    assert refresh_sources(sources, mirror_path)["status"].tolist()[0] == "not modified"
+
+    # Changed on the server:
+    (served / "members.csv").write_text("congress,icpsr\n118,1\n")
+    assert refresh_sources(sources, mirror_path)["status"].tolist()[0] == "updated"
+    assert open(local).read() == "congress,icpsr\n118,1\n"
+
+    # Edited locally, so it no longer matches the recorded checksum and is downloaded again:
+    with open(local, "w") as file:
+        file.write("edited")
+    assert refresh_sources(sources, mirror_path)["status"].tolist()[0] == "updated"
+    assert open(local).read() == "congress,icpsr\n118,1\n"
+
+    with open(mirror_path) as file:
+        assert json.load(file)[local]["url"] == url + "/members.csv"
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from resampling import get_feature_matrix, batched_least_squares
+
+
+def test_feature_matrix_drops_incomplete_rows():
+    df = pd.DataFrame({
+        "congress": [115, 115, 116, 116, 117],
+        "party": ["Democratic Party", "Republican Party", "Democratic Party", "Republican Party", "Democratic Party"],
+        "receipts": [1000.0, np.nan, 3000.0, 4000.0, 2500.0],
+        "population": [1.0, 2.0, 3.0, 4.0, 6.0],
+        "nominate_dim1": [-0.3, 0.4, -0.2, 0.5, np.nan],
+    })
+    X, y, groups, columns = get_feature_matrix(df, features=["receipts", "population"])
+
+    assert columns == ["intercept", "receipts", "population", "party_Republican Party"]
+    assert groups.tolist() == [115, 116, 116]
+    assert y.tolist() == [-0.3, -0.2, 0.5]
+    assert not np.isnan(X).any()
+
+    coefficients, r_squared = batched_least_squares(X, y, np.ones((1, len(y))))
+    assert np.isfinite(coefficients).all()